@@ -5,9 +5,26 @@ https://github.com/digimarketingai/termify
 
 import gradio as gr
 import openai
+import abc
+import hashlib
+import heapq
 import json
+import math
+import os
 import re
+import sqlite3
+import sys
+import threading
 import time
+import uuid
+import unicodedata
+from collections import Counter, defaultdict
+
+try:
+    import opencc
+    _T2S = opencc.OpenCC("t2s")
+except Exception:
+    _T2S = None
 
 
 def get_client(token=""):
@@ -21,6 +38,306 @@ def get_client(token=""):
 # Configuration constants
 MAX_CHARS = 20000
 CHUNK_SIZE = 2000  # Increased chunk size for better context
+MODEL = "mistral-small-latest"
+
+# Salience ranking and early termination
+CATEGORY_PRIORITY = {
+    "organization": 1.0, "medical": 1.0, "chemical": 0.9, "technical": 0.9,
+    "place": 0.8, "social": 0.8, "date": 0.5, "general": 0.4,
+}
+FOCUS_BOOST = 0.5  # Added to the priority of the category named in the focus
+STOP_CONFIDENCE = 0.9  # Skip remaining segments once the top N holds with this probability
+
+# Shared state (rate limits, response cache, jobs) across worker processes
+STATE_URL = os.environ.get("TERMIFY_STATE_URL", "sqlite:////tmp/termify_state.db")
+API_RATE = 2.0  # API calls per second per key, shared by all workers
+API_BURST = 2
+CACHE_TTL = 86400
+JOB_TTL = 3600
+
+
+# ========== SHARED STATE ==========
+
+class SharedState(abc.ABC):
+    """
+    Interface for state shared between worker processes.
+    Backends implement token-bucket pacing, a response cache and job records.
+    """
+
+    @abc.abstractmethod
+    def take_token(self, bucket, rate, burst):
+        """Try to take one token; return 0 on success or seconds to wait."""
+
+    @abc.abstractmethod
+    def cache_get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+
+    @abc.abstractmethod
+    def cache_set(self, key, value, ttl=CACHE_TTL):
+        """Store a string value under key for ttl seconds."""
+
+    @abc.abstractmethod
+    def job_get(self, job_id):
+        """Return the job record dict, or None if missing or expired."""
+
+    @abc.abstractmethod
+    def job_set(self, job_id, record, ttl=JOB_TTL):
+        """Store a job record dict for ttl seconds."""
+
+    def acquire(self, bucket, rate=API_RATE, burst=API_BURST):
+        """Block until a token is available in the named bucket."""
+        while True:
+            wait = self.take_token(bucket, rate, burst)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def job_update(self, job_id, **fields):
+        """Merge fields into a job record and stamp the update time."""
+        record = self.job_get(job_id) or {}
+        record.update(fields, updated=time.time())
+        self.job_set(job_id, record)
+
+
+class LocalState(SharedState):
+    """
+    In-process fallback used when the shared backend is unavailable.
+    Paces calls locally but never caches responses.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.jobs = {}
+
+    def take_token(self, bucket, rate, burst):
+        with self.lock:
+            now = time.time()
+            tokens, updated = self.buckets.get(bucket, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self.buckets[bucket] = (tokens, now)
+        return wait
+
+    def cache_get(self, key):
+        return None
+
+    def cache_set(self, key, value, ttl=CACHE_TTL):
+        pass
+
+    def job_get(self, job_id):
+        with self.lock:
+            record, expires = self.jobs.get(job_id, (None, 0))
+            if expires <= time.time():
+                self.jobs.pop(job_id, None)
+                return None
+        return record
+
+    def job_set(self, job_id, record, ttl=JOB_TTL):
+        with self.lock:
+            self.jobs[job_id] = (record, time.time() + ttl)
+
+
+class SQLiteState(SharedState):
+    """SQLite/WAL backend for several worker processes on one host."""
+
+    PURGE_EVERY = 100  # Writes between sweeps of expired cache and job rows
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL);
+            CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL);
+            CREATE TABLE IF NOT EXISTS jobs (key TEXT PRIMARY KEY, value TEXT, expires REAL);
+        """)
+        self.purge()
+
+    def purge(self):
+        """Delete expired cache and job rows."""
+        now = time.time()
+        self.db.execute("DELETE FROM cache WHERE expires < ?", (now,))
+        self.db.execute("DELETE FROM jobs WHERE expires < ?", (now,))
+
+    def take_token(self, bucket, rate, burst):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self.db.execute(
+                    "SELECT tokens, updated FROM buckets WHERE name = ?", (bucket,)
+                ).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+                if not wait:
+                    tokens -= 1
+                self.db.execute(
+                    "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (bucket, tokens, now)
+                )
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return wait
+
+    def _get(self, table, key):
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT value FROM {table} WHERE key = ? AND expires > ?",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, table, key, value, ttl):
+        with self.lock:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+            self.writes += 1
+            if self.writes % self.PURGE_EVERY == 0:
+                self.purge()
+
+    def cache_get(self, key):
+        return self._get("cache", key)
+
+    def cache_set(self, key, value, ttl=CACHE_TTL):
+        self._set("cache", key, value, ttl)
+
+    def job_get(self, job_id):
+        data = self._get("jobs", job_id)
+        return json.loads(data) if data else None
+
+    def job_set(self, job_id, record, ttl=JOB_TTL):
+        self._set("jobs", job_id, json.dumps(record, ensure_ascii=False), ttl)
+
+
+class RedisState(SharedState):
+    """Backend for any Redis-compatible server (Redis, Valkey, KeyDB, fakeredis)."""
+
+    TOKEN_SCRIPT = """
+        local now = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local burst = tonumber(ARGV[3])
+        local b = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = burst
+        if b[1] then
+            tokens = math.min(burst, tonumber(b[1]) + (now - tonumber(b[2])) * rate)
+        end
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], 3600)
+        return tostring(wait)
+    """
+
+    def __init__(self, client, prefix="termify:"):
+        self.client = client
+        self.prefix = prefix
+        self.take = client.register_script(self.TOKEN_SCRIPT)
+
+    def take_token(self, bucket, rate, burst):
+        wait = self.take(keys=[self.prefix + "bucket:" + bucket], args=[time.time(), rate, burst])
+        return float(wait)
+
+    def cache_get(self, key):
+        value = self.client.get(self.prefix + "cache:" + key)
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def cache_set(self, key, value, ttl=CACHE_TTL):
+        self.client.set(self.prefix + "cache:" + key, value, ex=int(ttl))
+
+    def job_get(self, job_id):
+        data = self.client.get(self.prefix + "job:" + job_id)
+        return json.loads(data) if data else None
+
+    def job_set(self, job_id, record, ttl=JOB_TTL):
+        self.client.set(self.prefix + "job:" + job_id, json.dumps(record, ensure_ascii=False), ex=int(ttl))
+
+
+_state = None
+_local_state = LocalState()
+
+
+def get_state():
+    """Return the process-wide shared state backend selected by TERMIFY_STATE_URL."""
+    global _state
+    if _state is None:
+        if STATE_URL.startswith(("redis://", "rediss://", "unix://")):
+            import redis
+            _state = RedisState(redis.Redis.from_url(STATE_URL))
+        else:
+            _state = SQLiteState(STATE_URL.replace("sqlite:///", "", 1))
+    return _state
+
+
+def call_api(client, system, prompt, parse):
+    """
+    Run one chat completion, sharing the response cache and the per-key
+    rate-limit bucket with every other worker. Returns (parse(content), content);
+    only responses that parse into at least one item are cached. If the shared
+    backend is down, calls are paced locally and not cached.
+    """
+    key = hashlib.sha256(json.dumps([MODEL, system, prompt]).encode("utf-8")).hexdigest()
+    try:
+        state = get_state()
+        cached = state.cache_get(key)
+    except Exception:
+        state, cached = _local_state, None
+    if cached is not None:
+        return parse(cached), cached
+    
+    bucket = hashlib.sha256(client.api_key.encode("utf-8")).hexdigest()[:16]
+    try:
+        state.acquire(bucket)
+    except Exception:
+        state = _local_state
+        state.acquire(bucket)
+    resp = client.chat.completions.create(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.1,
+        max_tokens=2500,
+    )
+    
+    content = resp.choices[0].message.content.strip()
+    items = parse(content)
+    if items:
+        try:
+            state.cache_set(key, content)
+        except Exception:
+            pass
+    return items, content
+
+
+def record_job(job_id, logs, **fields):
+    """Update a job record; backend failures are only noted in the debug log."""
+    try:
+        get_state().job_update(job_id, **fields)
+    except Exception as e:
+        logs.append(f"\n⚠️ Job state unavailable: {e}\n")
+
+
+def job_status(job_id):
+    """Look up a job record by id for the status panel."""
+    job_id = job_id.strip() if job_id else ""
+    if not job_id:
+        return ""
+    try:
+        record = get_state().job_get(job_id)
+    except Exception as e:
+        return f"⚠️ Job state unavailable: {e}"
+    if record is None:
+        return "❓ Unknown or expired job | 未知或已過期的任務"
+    return json.dumps(record, indent=2, ensure_ascii=False)
 
 
 def smart_chunk(text, size=2000):
@@ -80,6 +397,20 @@ def align_chunks(source_chunks, target_chunks):
     return aligned
 
 
+class Term:
+    """Compact term record. Category strings are interned so they are shared."""
+    __slots__ = ('source', 'target', 'category', 'count')
+
+    def __init__(self, source, target, category='general', count=1):
+        self.source = source
+        self.target = target
+        self.category = sys.intern(category)
+        self.count = count
+
+    def to_dict(self):
+        return {'source': self.source, 'target': self.target, 'category': self.category}
+
+
 def parse_terms(content):
     """Parse JSON term data from API response."""
     terms = []
@@ -109,7 +440,7 @@ def parse_terms(content):
                         continue
                     
                     if src and len(src) >= 2:
-                        terms.append({'source': src, 'target': tgt, 'category': cat})
+                        terms.append(Term(src, tgt, cat))
             return terms
     except:
         pass
@@ -128,11 +459,7 @@ def parse_terms(content):
                 if src == tgt and re.match(r'^[A-Za-z\s]+$', src):
                     continue
                     
-                terms.append({
-                    'source': src,
-                    'target': tgt,
-                    'category': str(obj.get('category', 'general')).strip().lower()
-                })
+                terms.append(Term(src, tgt, str(obj.get('category', 'general')).strip().lower()))
         except:
             pass
     
@@ -264,20 +591,13 @@ Output ONLY a JSON array:
 [{{"source":"中文術語","target":"English translation","category":"type"}}]"""
 
     try:
-        resp = client.chat.completions.create(
-            model="mistral-small-latest",
-            messages=[
-                {"role": "system", "content": "You are a precise bilingual terminology extractor. When given parallel texts, you MUST match Chinese terms with their English translations from the English text. The English translation is ALWAYS present in the parallel text - search carefully. NEVER output null or empty translations."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=2500,
+        return call_api(
+            client,
+            "You are a precise bilingual terminology extractor. When given parallel texts, you MUST match Chinese terms with their English translations from the English text. The English translation is ALWAYS present in the parallel text - search carefully. NEVER output null or empty translations.",
+            prompt,
+            parse_terms,
         )
         
-        content = resp.choices[0].message.content.strip()
-        terms = parse_terms(content)
-        return terms, content
-        
     except Exception as e:
         return [], str(e)
 
@@ -331,34 +651,181 @@ Output ONLY a JSON array:
 [{{"source":"中文術語","target":"English term","category":"type"}}]"""
 
     try:
-        resp = client.chat.completions.create(
-            model="mistral-small-latest",
-            messages=[
-                {"role": "system", "content": "You extract terminology from texts. Output only valid JSON arrays. Never include instruction text in output. Never use null for translations."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=2500,
+        return call_api(
+            client,
+            "You extract terminology from texts. Output only valid JSON arrays. Never include instruction text in output. Never use null for translations.",
+            prompt,
+            parse_terms,
         )
         
-        content = resp.choices[0].message.content.strip()
-        terms = parse_terms(content)
-        return terms, content
-        
     except Exception as e:
         return [], str(e)
 
 
+# Target keys per source clustered with the BK-tree; the rest join the nearest seed
+CLUSTER_SEEDS = 32
+
+# Separators that never distinguish one term from another
+KEY_SEPARATORS = "·・‧-‐‑–—_'\"‘’“”「」『』"
+# Whitespace, control and invisible format characters, plus the separators above
+_KEY_STRIP = re.compile(
+    r"[\s\x00-\x1f\x7f-\x9f\u00ad\u200b-\u200f\u2060-\u2064\ufeff" + re.escape(KEY_SEPARATORS) + "]"
+)
+
+
+def normalize_key(text):
+    """
+    Build a canonical key for near-duplicate matching.
+    Folds full/half-width forms, case, whitespace and separator punctuation,
+    and traditional/simplified Chinese when opencc is installed. Symbols such
+    as +, #, %, ° and decimal points are kept so C++ and C stay distinct.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    if _T2S is not None:
+        text = _T2S.convert(text)
+    return _KEY_STRIP.sub("", text)
+
+
+def edit_distance(a, b, limit=None):
+    """
+    Levenshtein distance between two strings. With a limit, stops early and
+    returns limit + 1 once the distance is known to exceed it.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if limit is not None and min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+class BKTree:
+    """Burkhard-Keller tree for edit-distance lookups on target keys."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            d = edit_distance(word, node[0])
+            if d == 0:
+                return
+            if d not in node[1]:
+                node[1][d] = (word, {})
+                return
+            node = node[1][d]
+
+    def search(self, word, radius):
+        """Return all stored words within `radius` edits of `word`."""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_word, children = stack.pop()
+            d = edit_distance(word, node_word)
+            if d <= radius:
+                found.append(node_word)
+            for dist, child in children.items():
+                if d - radius <= dist <= d + radius:
+                    stack.append(child)
+        return found
+
+
+def cluster_targets(target_counts):
+    """
+    Group normalized target keys whose edit distance is small relative to
+    their length. Returns a list of clusters (lists of keys), most
+    frequent keys seeding clusters first.
+    
+    Only the CLUSTER_SEEDS most frequent keys are clustered with the BK-tree.
+    Each remaining key joins the closest seed of similar length within range,
+    or stays on its own, so work per source stays bounded.
+    """
+    ranked = sorted(target_counts, key=lambda k: (-target_counts[k], k))
+    seeds, tail = ranked[:CLUSTER_SEEDS], ranked[CLUSTER_SEEDS:]
+    
+    tree = BKTree()
+    for key in seeds:
+        tree.add(key)
+    
+    cluster_of = {}
+    clusters = []
+    for key in seeds:
+        if key in cluster_of:
+            continue
+        radius = max(1, len(key) // 8)
+        members = [k for k in tree.search(key, radius) if k not in cluster_of]
+        for k in members:
+            cluster_of[k] = len(clusters)
+        clusters.append(members)
+    
+    seeds_by_len = defaultdict(list)
+    for key in seeds:
+        seeds_by_len[len(key)].append(key)
+    
+    for key in tail:
+        radius = max(1, len(key) // 8)
+        best, best_d = None, radius + 1
+        for length in range(len(key) - radius, len(key) + radius + 1):
+            for seed in seeds_by_len.get(length, ()):
+                d = edit_distance(key, seed, best_d - 1)
+                if d < best_d:
+                    best, best_d = seed, d
+        if best is None:
+            clusters.append([key])
+        else:
+            clusters[cluster_of[best]].append(key)
+    return clusters
+
+
 def dedupe(terms):
-    """Remove duplicate terms, keeping the best translation."""
-    seen = {}
+    """
+    Merge near-duplicate terms, keeping the most frequent translation.
+    Terms are bucketed by normalized source key in one pass; targets in a
+    bucket are clustered by edit distance so spelling variants pool their
+    votes. Each kept term's count is how often it was seen.
+    """
+    groups = defaultdict(list)
     for t in terms:
-        key = t['source'].lower()
-        if key not in seen:
-            seen[key] = t
-        elif len(t['target']) > len(seen[key]['target']):
-            seen[key] = t
-    return list(seen.values())
+        key = normalize_key(t.source) or t.source.casefold()
+        if key:
+            groups[key].append(t)
+    
+    merged = []
+    for group in groups.values():
+        if len(group) == 1:
+            t = group[0]
+            merged.append(Term(t.source, t.target, t.category, 1))
+            continue
+        
+        by_target = defaultdict(list)
+        for t in group:
+            by_target[normalize_key(t.target) or t.target.casefold()].append(t)
+        
+        if len(by_target) == 1:
+            variants = group
+        else:
+            counts = {k: len(v) for k, v in by_target.items()}
+            best = max(
+                cluster_targets(counts),
+                key=lambda c: (sum(counts[k] for k in c), max(counts[k] for k in c)),
+            )
+            variants = [t for k in best for t in by_target[k]]
+        
+        # Most common surface form wins; ties go to the longer target
+        surface = Counter((t.source, t.target) for t in variants)
+        (src, tgt), _ = max(surface.items(), key=lambda kv: (kv[1], len(kv[0][1])))
+        cats = Counter(t.category for t in variants)
+        merged.append(Term(src, tgt, cats.most_common(1)[0][0], len(group)))
+    return merged
 
 
 def validate_terms(terms):
@@ -374,8 +841,8 @@ def validate_terms(terms):
     invalid_targets = ['null', 'none', 'n/a', 'undefined', 'nil', '']
     
     for t in terms:
-        src = t['source'].strip()
-        tgt = t['target'].strip() if t.get('target') else ''
+        src = t.source.strip()
+        tgt = t.target.strip() if t.target else ''
         
         # Skip if source or target is empty/null
         if not src or not tgt:
@@ -405,6 +872,149 @@ def validate_terms(terms):
     return valid
 
 
+def focus_category(focus):
+    """Return the category named by a focus keyword, if any."""
+    focus_lower = focus.lower()
+    for cat in CATEGORY_PRIORITY:
+        if re.search(rf'\b{cat}\b', focus_lower):
+            return cat
+    return None
+
+
+def termhood(term):
+    """Heuristic 0-1 score for how term-like a source/target pair is."""
+    score = 0.5
+    if 2 <= len(term.source) <= 12:
+        score += 0.25
+    if re.search(r'[A-Z][a-z]+', term.target) or term.target.isupper():
+        score += 0.25
+    return score
+
+
+def salience(term, focus_cat=None, count=None):
+    """
+    Rank a term by cross-segment frequency, termhood and category priority.
+    Pass count to score the term as if it had been seen that many times.
+    """
+    priority = CATEGORY_PRIORITY.get(term.category, 0.4)
+    if focus_cat and term.category == focus_cat:
+        priority += FOCUS_BOOST
+    count = term.count if count is None else count
+    return (1 + math.log1p(count)) * termhood(term) * priority
+
+
+def rank_key(term, focus_cat=None):
+    """Sort key: salience, then frequency, then longer (more specific) sources."""
+    return (salience(term, focus_cat), term.count, len(term.source), term.source)
+
+
+def expected_yield(source, target):
+    """Estimate how many terms a segment holds from cheap surface cues."""
+    hits = len(re.findall(r'[\u4e00-\u9fff]{1,8}(?:署|處|局|部|中心|委員會|醫院|公司|協會|大學|區|道|山|徑)', source))
+    hits += len(re.findall(r'\d+', source))
+    if target:
+        hits += len(re.findall(r'\b[A-Z][a-z]+(?:\s+(?:of\s+|for\s+|and\s+)?[A-Z][a-z]+)*', target))
+    return hits + len(source) / 500
+
+
+def top_terms(terms, max_terms, focus_cat=None):
+    """Dedupe validated terms and return the max_terms most salient ones."""
+    unique_terms = dedupe(terms)
+    return heapq.nlargest(int(max_terms), unique_terms, key=lambda t: rank_key(t, focus_cat)), unique_terms
+
+
+def binomial_pmf(n, p):
+    """Probabilities of 0..n successes for X ~ Binomial(n, p)."""
+    return [math.comb(n, k) * p ** k * (1 - p) ** (n - k) for k in range(n + 1)]
+
+
+def term_key(term):
+    """Key under which dedupe groups a term."""
+    return normalize_key(term.source) or term.source.casefold()
+
+
+def overtake_risk(pool, max_terms, processed, remaining, first_seen, new_terms, focus_cat=None):
+    """
+    Expected number of terms outside the current top max_terms that would
+    finish above its cutoff if the remaining segments were processed.
+    
+    A term's recurrence rate is estimated from the segments after the one it
+    was first seen in, shrunk towards the rate pooled over all terms. Final
+    counts are binomial over the remaining segments; a challenger counts as
+    overtaking when its final score beats the cutoff's, and half when they
+    tie. Terms tied with the cutoff now are interchangeable with it and are
+    skipped. Terms not seen yet arrive at the rate the latest segment brought
+    new ones, in the best category.
+    """
+    n = int(max_terms)
+    if len(pool) < n:
+        return float("inf")
+    
+    recurrences = sum(t.count - 1 for t in pool)
+    chances = sum(processed - first_seen[term_key(t)] for t in pool)
+    base_rate = (recurrences + 0.5) / (chances + 1)
+    
+    def final_scores(term, count, segments, rate):
+        probs = binomial_pmf(segments, rate)
+        return [(salience(term, focus_cat, count + k), p) for k, p in enumerate(probs)]
+    
+    def term_rate(term):
+        seen_for = processed - first_seen[term_key(term)]
+        return (term.count - 1 + base_rate) / (seen_for + 1)
+    
+    top = heapq.nlargest(n, pool, key=lambda t: rank_key(t, focus_cat))
+    cutoff = top[-1]
+    cut_score = salience(cutoff, focus_cat)
+    cut_final = final_scores(cutoff, cutoff.count, remaining, term_rate(cutoff))
+    cut_low = cut_final[0][0]
+    
+    def beats_cutoff(finals):
+        if finals[-1][0] < cut_low:
+            return 0.0
+        prob = 0.0
+        for score, p in finals:
+            for cut, q in cut_final:
+                if score > cut:
+                    prob += p * q
+                elif score == cut:
+                    prob += 0.5 * p * q
+        return prob
+    
+    top_ids = {id(t) for t in top}
+    risk = 0.0
+    for t in pool:
+        if id(t) in top_ids or salience(t, focus_cat) == cut_score:
+            continue
+        risk += beats_cutoff(final_scores(t, t.count, remaining, term_rate(t)))
+    
+    if new_terms:
+        best_cat = focus_cat or max(CATEGORY_PRIORITY, key=CATEGORY_PRIORITY.get)
+        unseen = Term("新詞", "New Term", best_cat)
+        # Assume each arrival comes in the next segment, the earliest it could
+        risk += new_terms * remaining * beats_cutoff(final_scores(unseen, 1, remaining - 1, base_rate))
+    return risk
+
+
+def render_table(terms):
+    """Render terms as a Markdown table."""
+    rows = ["| # | Source | Target | Category |\n|:---:|:---|:---|:---:|\n"]
+    for i, t in enumerate(terms, 1):
+        src = t.source.replace('|', '∣')
+        tgt = t.target.replace('|', '∣')
+        rows.append(f"| {i} | {src} | {tgt} | {t.category} |\n")
+    return "".join(rows)
+
+
+def render_csv(terms):
+    """Render terms as CSV text with a header row."""
+    csv_lines = ["Source,Target,Category"]
+    for t in terms:
+        src_csv = t.source.replace('"', '""')
+        tgt_csv = t.target.replace('"', '""')
+        csv_lines.append(f'"{src_csv}","{tgt_csv}","{t.category}"')
+    return "\n".join(csv_lines)
+
+
 def extract_terms(source_text, target_text, focus, max_terms, api_token, progress=gr.Progress()):
     """Main extraction function."""
     if not source_text or not source_text.strip():
@@ -431,62 +1041,95 @@ def extract_terms(source_text, target_text, focus, max_terms, api_token, progres
     target_chunks = smart_chunk(target_text, CHUNK_SIZE) if target_text else []
     aligned_pairs = align_chunks(source_chunks, target_chunks)
     
+    # Visit the richest segments first so the top-N settles early
+    order = sorted(range(len(aligned_pairs)), key=lambda i: -expected_yield(*aligned_pairs[i]))
+    focus_cat = None if use_custom_mode else focus_category(focus)
+    
     progress(0.1, desc=f"🔄 Processing {len(aligned_pairs)} segment(s)...")
     
     all_terms = []
     debug_logs = []
     start_time = time.time()
     
+    job_id = uuid.uuid4().hex
+    record_job(job_id, debug_logs, status="running", done=0, total=len(aligned_pairs), started=start_time)
+    
     mode_label = "CUSTOM COMMAND" if use_custom_mode else "STANDARD"
     debug_logs.append(f"Mode: {mode_label}\n")
-    debug_logs.append(f"API: Mistral (mistral-small-latest)\n")
+    debug_logs.append(f"API: Mistral ({MODEL})\n")
     if use_custom_mode:
         debug_logs.append(f"User Command: {focus}\n")
     
-    for i, (src, tgt) in enumerate(aligned_pairs):
-        progress(0.1 + 0.7 * ((i + 1) / len(aligned_pairs)), 
-                desc=f"🤖 Segment {i+1}/{len(aligned_pairs)}...")
-        
-        # Use custom extraction if in custom mode
-        if use_custom_mode:
-            terms, raw = extract_chunk_custom(src, tgt, focus, client)
-        else:
-            terms, raw = extract_chunk(src, tgt, focus, client)
-        
-        debug_logs.append(f"""
+    processed = 0
+    raw_extracted = 0
+    valid_count = 0
+    first_seen = {}
+    
+    try:
+        for n, i in enumerate(order):
+            src, tgt = aligned_pairs[i]
+            progress(0.1 + 0.7 * ((n + 1) / len(aligned_pairs)), 
+                    desc=f"🤖 Segment {i+1}/{len(aligned_pairs)}...")
+            
+            # Use custom extraction if in custom mode
+            if use_custom_mode:
+                terms, raw = extract_chunk_custom(src, tgt, focus, client)
+            else:
+                terms, raw = extract_chunk(src, tgt, focus, client)
+            
+            debug_logs.append(f"""
 === Segment {i+1} ===
 Source: {len(src)} chars | Target: {len(tgt)} chars
 Raw terms: {len(terms)}
 Response preview: {raw[:600]}...
 """)
+            
+            # Count each term once per segment so count means segment frequency
+            valid = validate_terms(terms)
+            raw_extracted += len(terms)
+            valid_count += len(valid)
+            seg_terms = dedupe(valid)
+            new_terms = 0
+            for t in seg_terms:
+                t.count = 1
+                key = term_key(t)
+                if key not in first_seen:
+                    first_seen[key] = n + 1
+                    new_terms += 1
+            all_terms.extend(seg_terms)
+            processed = n + 1
+            record_job(job_id, debug_logs, done=processed)
+            
+            # Stop once the top N is unlikely to change in the remaining segments
+            remaining = len(order) - processed
+            if remaining:
+                risk = overtake_risk(dedupe(all_terms), max_terms, processed, remaining, first_seen, new_terms, focus_cat)
+                debug_logs.append(f"Overtake risk: {risk:.3f}\n")
+                if risk < 1 - STOP_CONFIDENCE:
+                    debug_logs.append(f"\nTop {int(max_terms)} settled - skipped {remaining} segment(s)\n")
+                    break
         
-        all_terms.extend(terms)
+        progress(0.85, desc="🔍 Cleaning results...")
         
-        if i < len(aligned_pairs) - 1:
-            time.sleep(0.5)
-    
-    progress(0.85, desc="🔍 Cleaning results...")
-    
-    valid_terms = validate_terms(all_terms)
-    unique_terms = dedupe(valid_terms)
-    raw_count = len(unique_terms)
-    
-    # Sort terms by category and source
-    unique_terms.sort(key=lambda t: (t.get('category', 'zzz'), t['source']))
-    
-    final_terms = unique_terms[:max_terms]
+        final_terms, unique_terms = top_terms(all_terms, max_terms, focus_cat)
+        raw_count = len(unique_terms)
+    except Exception as e:
+        record_job(job_id, debug_logs, status="error", error=str(e))
+        raise
     
     elapsed = time.time() - start_time
+    record_job(job_id, debug_logs, status="done", terms=len(final_terms), elapsed=elapsed)
     
     debug_log = f"""=== EXTRACTION SUMMARY ===
 Mode: {mode_label}
-API: Mistral (mistral-small-latest)
+API: Mistral ({MODEL})
+Job: {job_id}
 Focus/Command: {focus if focus else 'None'}
-Segments: {len(aligned_pairs)}
+Segments: {processed}/{len(aligned_pairs)}
 Time: {elapsed:.1f}s
 
-Raw extracted: {len(all_terms)}
-After validation: {len(valid_terms)}
+Raw extracted: {raw_extracted}
+After validation: {valid_count}
 After dedupe: {raw_count}
 Final: {len(final_terms)}
 
@@ -501,21 +1144,8 @@ Final: {len(final_terms)}
     
     progress(0.95, desc="📊 Formatting...")
     
-    # Build result table
-    table = "| # | Source | Target | Category |\n|:---:|:---|:---|:---:|\n"
-    for i, t in enumerate(final_terms, 1):
-        src = t['source'].replace('|', '∣')
-        tgt = t['target'].replace('|', '∣')
-        cat = t.get('category', 'general')
-        table += f"| {i} | {src} | {tgt} | {cat} |\n"
-    
-    # Build CSV
-    csv_lines = ["Source,Target,Category"]
-    for t in final_terms:
-        src_csv = t["source"].replace('"', '""')
-        tgt_csv = t["target"].replace('"', '""')
-        csv_lines.append(f'"{src_csv}","{tgt_csv}","{t.get("category", "general")}"')
-    csv_content = "\n".join(csv_lines)
+    table = render_table(final_terms)
+    csv_content = render_csv(final_terms)
     
     progress(1.0, desc="✅ Done!")
     
@@ -537,11 +1167,7 @@ def save_file(csv_content, fmt):
     for line in lines:
         parts = line.split('","')
         if len(parts) >= 3:
-            terms.append({
-                'source': parts[0].strip('"'),
-                'target': parts[1],
-                'category': parts[2].strip('"')
-            })
+            terms.append(Term(parts[0].strip('"'), parts[1], parts[2].strip('"')))
     
     paths = {
         "csv": "/tmp/termify_glossary.csv",
@@ -556,43 +1182,46 @@ def save_file(csv_content, fmt):
             f.write(csv_content)
     elif fmt == "json":
         with open(path, "w", encoding="utf-8") as f:
-            json.dump({"terms": terms, "count": len(terms)}, f, indent=2, ensure_ascii=False)
+            json.dump({"terms": [t.to_dict() for t in terms], "count": len(terms)}, f, indent=2, ensure_ascii=False)
     elif fmt == "tsv":
         with open(path, "w", encoding="utf-8") as f:
             for t in terms:
-                f.write(f"{t['source']}\t{t['target']}\n")
+                f.write(f"{t.source}\t{t.target}\n")
     elif fmt == "tbx":
-        tbx = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        tbx += '<!DOCTYPE martif SYSTEM "TBXcoreStructV02.dtd">\n'
-        tbx += '<martif type="TBX" xml:lang="en">\n'
-        tbx += '  <martifHeader>\n'
-        tbx += '    <fileDesc>\n'
-        tbx += '      <titleStmt>\n'
-        tbx += '        <title>Termify Glossary Export</title>\n'
-        tbx += '      </titleStmt>\n'
-        tbx += '    </fileDesc>\n'
-        tbx += '  </martifHeader>\n'
-        tbx += '  <text>\n'
-        tbx += '    <body>\n'
+        tbx_parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<!DOCTYPE martif SYSTEM "TBXcoreStructV02.dtd">\n'
+            '<martif type="TBX" xml:lang="en">\n'
+            '  <martifHeader>\n'
+            '    <fileDesc>\n'
+            '      <titleStmt>\n'
+            '        <title>Termify Glossary Export</title>\n'
+            '      </titleStmt>\n'
+            '    </fileDesc>\n'
+            '  </martifHeader>\n'
+            '  <text>\n'
+            '    <body>\n'
+        ]
         for i, t in enumerate(terms):
-            src_escaped = t["source"].replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-            tgt_escaped = t["target"].replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-            tbx += f'      <termEntry id="t{i+1}">\n'
-            tbx += f'        <descrip type="subjectField">{t.get("category", "general")}</descrip>\n'
-            tbx += f'        <langSet xml:lang="zh">\n'
-            tbx += f'          <tig>\n'
-            tbx += f'            <term>{src_escaped}</term>\n'
-            tbx += f'          </tig>\n'
-            tbx += f'        </langSet>\n'
-            tbx += f'        <langSet xml:lang="en">\n'
-            tbx += f'          <tig>\n'
-            tbx += f'            <term>{tgt_escaped}</term>\n'
-            tbx += f'          </tig>\n'
-            tbx += f'        </langSet>\n'
-            tbx += f'      </termEntry>\n'
-        tbx += '    </body>\n'
-        tbx += '  </text>\n'
-        tbx += '</martif>'
+            src_escaped = t.source.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            tgt_escaped = t.target.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            tbx_parts.append(
+                f'      <termEntry id="t{i+1}">\n'
+                f'        <descrip type="subjectField">{t.category}</descrip>\n'
+                f'        <langSet xml:lang="zh">\n'
+                f'          <tig>\n'
+                f'            <term>{src_escaped}</term>\n'
+                f'          </tig>\n'
+                f'        </langSet>\n'
+                f'        <langSet xml:lang="en">\n'
+                f'          <tig>\n'
+                f'            <term>{tgt_escaped}</term>\n'
+                f'          </tig>\n'
+                f'        </langSet>\n'
+                f'      </termEntry>\n'
+            )
+        tbx_parts.append('    </body>\n  </text>\n</martif>')
+        tbx = "".join(tbx_parts)
         with open(path, "w", encoding="utf-8") as f:
             f.write(tbx)
     
@@ -668,6 +1297,10 @@ with gr.Blocks(title="Termify - Terminology Extractor", theme=gr.themes.Soft())
     
     with gr.Accordion("🔧 Debug Log | 除錯日誌", open=False):
         debug_box = gr.Textbox(lines=15, show_copy_button=True)
+        with gr.Row():
+            job_box = gr.Textbox(label="Job ID | 任務編號", placeholder="Paste the Job ID from the debug log...", scale=3)
+            job_btn = gr.Button("🔎 Check Status | 查詢狀態", scale=1)
+        job_status_box = gr.Textbox(label="Job Status | 任務狀態", lines=6)
     
     with gr.Accordion("💡 Tips & Examples | 使用提示與範例", open=False):
         gr.Markdown("""
@@ -706,7 +1339,7 @@ Enter full commands in the Focus field for precise control:
 ## Tips | 提示
 
 - **With target text**: Provides more accurate translations
-- **Max Terms**: Limits results to top N terms
+- **Max Terms**: Keeps the N most salient terms; small N finishes sooner by skipping segments once they are unlikely to change the top N
 - **Export formats**: CSV (Excel), JSON (APIs), TSV (CAT tools), TBX (professional)
         """)
     
@@ -722,6 +1355,8 @@ Enter full commands in the Focus field for precise control:
         outputs=[source_box, target_box, focus_box, max_slider, token_box, result_box, csv_state, download_row]
     )
     
+    job_btn.click(job_status, inputs=[job_box], outputs=[job_status_box])
+    
     csv_btn.click(lambda c: save_file(c, "csv"), inputs=[csv_state], outputs=[file_output])
     json_btn.click(lambda c: save_file(c, "json"), inputs=[csv_state], outputs=[file_output])
     tsv_btn.click(lambda c: save_file(c, "tsv"), inputs=[csv_state], outputs=[file_output])
@@ -0,0 +1,89 @@
+"""
+Termify - term record benchmark
+Compares per-item dicts against compact Term records at corpus scale:
+memory, top-N selection and Markdown rendering.
+
+Usage: python benchmark.py [N ...]
+"""
+
+import heapq
+import random
+import sys
+import time
+import tracemalloc
+
+from app import Term, rank_key, render_table
+
+
+CATEGORIES = ["medical", "organization", "place", "social", "technical", "chemical", "date", "general"]
+TOP_N = 300
+
+
+def make_raw(n, seed=0):
+    """Generate raw (source, target, CATEGORY) tuples as the parser sees them."""
+    rng = random.Random(seed)
+    raw = []
+    for i in range(n):
+        src = "".join(chr(rng.randint(0x4E00, 0x9FFF)) for _ in range(rng.randint(2, 6)))
+        raw.append((src, f"Term {i}", rng.choice(CATEGORIES).upper()))
+    return raw
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    items = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return items, size, elapsed
+
+
+def render_concat(terms):
+    """The pre-join table renderer: same escaping as render_table, built with +=."""
+    table = "| # | Source | Target | Category |\n|:---:|:---|:---|:---:|\n"
+    for i, t in enumerate(terms, 1):
+        src = t.source.replace('|', '∣')
+        tgt = t.target.replace('|', '∣')
+        table += f"| {i} | {src} | {tgt} | {t.category} |\n"
+    return table
+
+
+def bench(n):
+    raw = make_raw(n)
+
+    # Both builds lower-case the category like parse_terms, creating a new string per item
+    dicts, dict_mem, dict_time = measure(
+        lambda: [{'source': s, 'target': t, 'category': c.lower()} for s, t, c in raw]
+    )
+    records, rec_mem, rec_time = measure(lambda: [Term(s, t, c.lower()) for s, t, c in raw])
+
+    # Same Term list and the app's rank_key for both, so only the algorithm differs
+    start = time.perf_counter()
+    sorted(records, key=rank_key, reverse=True)[:TOP_N]
+    sort_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    heapq.nlargest(TOP_N, records, key=rank_key)
+    heap_time = time.perf_counter() - start
+
+    # Same records and escaping for both, so only += versus join differs
+    start = time.perf_counter()
+    render_concat(records)
+    concat_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    render_table(records)
+    join_time = time.perf_counter() - start
+
+    print(f"=== {n:,} terms ===")
+    print(f"Build:   dict {dict_mem / 2**20:8.1f} MiB {dict_time:6.2f}s | Term {rec_mem / 2**20:8.1f} MiB {rec_time:6.2f}s")
+    print(f"Top-{TOP_N}: sort+slice {sort_time:6.2f}s | heapq.nlargest {heap_time:6.2f}s")
+    print(f"Render:  += {concat_time:6.2f}s | join {join_time:6.2f}s")
+    print()
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [100_000, 1_000_000]
+    for n in sizes:
+        bench(n)
@@ -0,0 +1,319 @@
+import json
+import random
+import re
+
+import pytest
+
+pytest.importorskip("gradio")
+pytest.importorskip("openai")
+
+import app
+from app import Term
+
+
+def test_normalize_key_folds_width_case_and_separators():
+    assert app.normalize_key("ＡＢＣ") == app.normalize_key("abc")
+    assert app.normalize_key("Covid-19") == app.normalize_key("COVID 19")
+    assert app.normalize_key("聖·保羅") == app.normalize_key("聖保羅")
+
+
+def test_normalize_key_keeps_meaningful_symbols():
+    keys = {app.normalize_key(s) for s in ["C++", "C#", "°C", "C"]}
+    assert len(keys) == 4
+    assert app.normalize_key("3.5%") != app.normalize_key("35")
+
+
+def test_dedupe_keeps_symbol_distinct_terms():
+    merged = app.dedupe([Term("C++", "C plus plus"), Term("C", "C language")])
+    assert sorted(t.source for t in merged) == ["C", "C++"]
+    assert all(t.count == 1 for t in merged)
+
+
+def test_dedupe_keeps_symbol_only_sources():
+    merged = app.dedupe([Term("——", "em dash")])
+    assert [t.target for t in merged] == ["em dash"]
+
+
+def test_normalize_key_folds_traditional_and_simplified():
+    pytest.importorskip("opencc")
+    assert app._T2S is not None
+    assert app.normalize_key("醫院") == app.normalize_key("医院")
+    merged = app.dedupe([Term("醫院", "Hospital"), Term("医院", "Hospital")])
+    assert len(merged) == 1
+    assert merged[0].count == 2
+
+
+def test_cluster_targets_joins_tail_to_nearest_seed():
+    counts = {f"target number {i:02d}": 2 for i in range(app.CLUSTER_SEEDS + 8)}
+    counts["kowloon bay area"] = 3
+    counts["kowloon bay areas"] = 1
+    clusters = app.cluster_targets(counts)
+    assert ["kowloon bay area", "kowloon bay areas"] in clusters
+    assert sorted(k for c in clusters for k in c) == sorted(counts)
+
+
+def test_dedupe_prefers_most_frequent_target():
+    merged = app.dedupe([
+        Term("香港", "HK"),
+        Term("香港", "Hong Kong"),
+        Term("香 港", "Hongkong"),
+    ])
+    assert len(merged) == 1
+    assert merged[0].target == "Hong Kong"
+    assert merged[0].count == 3
+
+
+class FakeClient:
+    """Stands in for the OpenAI client, returning canned chat responses."""
+
+    api_key = "test-key"
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, model, messages, **kwargs):
+        self.calls += 1
+        content = self.responses.pop(0)
+        message = type("Message", (), {"content": content})
+        choice = type("Choice", (), {"message": message})
+        return type("Response", (), {"choices": [choice]})
+
+
+class BrokenState(app.SharedState):
+    def _fail(self, *args, **kwargs):
+        raise OSError("backend down")
+
+    take_token = cache_get = cache_set = job_get = job_set = _fail
+
+
+def test_shared_state_rejects_incomplete_backend():
+    class Partial(app.SharedState):
+        def take_token(self, bucket, rate, burst):
+            return 0
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_sqlite_state_purges_expired_rows(tmp_path):
+    state = app.SQLiteState(str(tmp_path / "state.db"))
+    state.cache_set("old", "x", ttl=-1)
+    state.job_set("old", {"status": "done"}, ttl=-1)
+    assert state.cache_get("old") is None
+    state.purge()
+    assert state.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 0
+    assert state.db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
+
+
+def test_local_state_expires_jobs():
+    state = app.LocalState()
+    state.job_set("live", {"status": "running"})
+    state.job_set("old", {"status": "done"}, ttl=-1)
+    assert state.job_get("live") == {"status": "running"}
+    assert state.job_get("old") is None
+    assert "old" not in state.jobs
+
+
+def test_redis_state_token_bucket():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    state = app.RedisState(fakeredis.FakeRedis())
+    assert state.take_token("k", rate=1.0, burst=2) == 0
+    assert state.take_token("k", rate=1.0, burst=2) == 0
+    wait = state.take_token("k", rate=1.0, burst=2)
+    assert 0 < wait <= 1.0
+
+
+def test_redis_state_cache_and_jobs():
+    fakeredis = pytest.importorskip("fakeredis")
+    state = app.RedisState(fakeredis.FakeRedis())
+    assert state.cache_get("missing") is None
+    state.cache_set("k", "香港 Hong Kong")
+    assert state.cache_get("k") == "香港 Hong Kong"
+    assert state.job_get("missing") is None
+    state.job_update("j", status="running", done=0)
+    state.job_update("j", done=2)
+    record = state.job_get("j")
+    assert record["status"] == "running"
+    assert record["done"] == 2
+
+
+def test_call_api_caches_only_parseable_responses(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "_state", app.SQLiteState(str(tmp_path / "state.db")))
+    good = '[{"source":"香港","target":"Hong Kong","category":"place"}]'
+    client = FakeClient(["not json", "not json", good, good])
+
+    for _ in range(2):
+        terms, _ = app.call_api(client, "sys", "bad prompt", app.parse_terms)
+        assert terms == []
+    for _ in range(2):
+        terms, _ = app.call_api(client, "sys", "good prompt", app.parse_terms)
+        assert [t.target for t in terms] == ["Hong Kong"]
+    assert client.calls == 3
+
+
+def test_extraction_survives_broken_backend(monkeypatch):
+    monkeypatch.setattr(app, "_state", BrokenState())
+    good = '[{"source":"香港","target":"Hong Kong","category":"place"}]'
+    monkeypatch.setattr(app, "get_client", lambda token: FakeClient([good]))
+
+    result, csv_content, _, debug_log = app.extract_terms(
+        "香港", "", "", 20, "key", progress=lambda *a, **k: None
+    )
+    assert "Hong Kong" in csv_content
+    assert "Job state unavailable" in debug_log
+
+
+def run_extraction(monkeypatch, segment_terms, max_terms, focus=""):
+    """Run extract_terms over one segment per entry, with a fake call_api."""
+    calls = []
+
+    def fake_call_api(client, system, prompt, parse):
+        seg = int(re.search(r"第(\d+)段", prompt).group(1))
+        calls.append(seg)
+        content = json.dumps(
+            [{"source": s, "target": t, "category": c} for s, t, c in segment_terms[seg]],
+            ensure_ascii=False,
+        )
+        return parse(content), content
+
+    monkeypatch.setattr(app, "_state", app.LocalState())
+    monkeypatch.setattr(app, "call_api", fake_call_api)
+    monkeypatch.setattr(app, "get_client", lambda token: None)
+    source = "\n\n".join(f"第{k}段" + "文" * (app.CHUNK_SIZE - 10) for k in range(len(segment_terms)))
+    result = app.extract_terms(source, "", focus, max_terms, "key", progress=lambda *a, **k: None)
+    return calls, result
+
+
+def kept_sources(csv_content):
+    return [line.split('","')[0].strip('"') for line in csv_content.splitlines()[1:]]
+
+
+@pytest.mark.parametrize("max_terms", [20, 150])
+def test_disjoint_segments_do_not_stop_early(monkeypatch, max_terms):
+    segment_terms = [
+        [(f"機構{k}號{j}", f"Agency Number {k} {j}", "organization") for j in range(40)]
+        for k in range(10)
+    ]
+    calls, (_, _, _, debug_log) = run_extraction(monkeypatch, segment_terms, max_terms)
+    assert sorted(calls) == list(range(10))
+    assert "Segments: 10/10" in debug_log
+
+
+def recurring_segments():
+    """
+    30 recurring terms over 10 segments plus 5 one-off terms per segment:
+    10 organizations in every segment, 10 organizations missing one segment
+    each and 10 places missing two segments each.
+    """
+    segments = []
+    for k in range(10):
+        terms = [(f"常設機構{j}", f"Standing Agency {j}", "organization") for j in range(10)]
+        terms += [(f"分區機構{j}", f"District Agency {j}", "organization") for j in range(10) if j != k]
+        terms += [(f"地點{j}", f"Place {j}", "place") for j in range(10) if k not in (j, (j + 5) % 10)]
+        terms += [(f"雜項{k}號{j}", f"Misc Item {k} {j}", "general") for j in range(5)]
+        segments.append(terms)
+    return segments
+
+
+def test_recurring_terms_stop_early_with_full_run_top_n(monkeypatch):
+    calls, (_, csv_content, _, debug_log) = run_extraction(monkeypatch, recurring_segments(), 20)
+    assert len(calls) < 10, calls
+
+    monkeypatch.setattr(app, "STOP_CONFIDENCE", 1.0)
+    full_calls, (_, full_csv, _, _) = run_extraction(monkeypatch, recurring_segments(), 20)
+    assert len(full_calls) == 10
+    assert sorted(kept_sources(csv_content)) == sorted(kept_sources(full_csv))
+
+
+def test_overtake_risk_ignores_ties_at_cutoff():
+    # 25 interchangeable terms seen in all 4 segments; the top 20 cuts the tie group
+    pool = [Term(f"機構{j}", f"Agency {j}", "organization", 4) for j in range(25)]
+    first_seen = {app.term_key(t): 1 for t in pool}
+    assert app.overtake_risk(pool, 20, 4, 6, first_seen, 0) == 0
+
+
+def test_focus_category_matches_whole_words():
+    assert app.focus_category("update records") is None
+    assert app.focus_category("replace terms") is None
+    assert app.focus_category("place names") == "place"
+    assert app.focus_category("social media") == "social"
+
+
+def test_term_interns_category_and_converts_to_dict():
+    a = Term("香港", "Hong Kong", "".join(["pl", "ace"]))
+    b = Term("九龍", "Kowloon", "place")
+    assert a.category is b.category
+    assert a.to_dict() == {"source": "香港", "target": "Hong Kong", "category": "place"}
+    with pytest.raises(AttributeError):
+        a.extra = 1
+
+
+def test_render_table_escapes_pipes():
+    table = app.render_table([Term("甲|乙", "A|B", "general"), Term("香港", "Hong Kong", "place")])
+    assert table == (
+        "| # | Source | Target | Category |\n|:---:|:---|:---|:---:|\n"
+        "| 1 | 甲∣乙 | A∣B | general |\n"
+        "| 2 | 香港 | Hong Kong | place |\n"
+    )
+
+
+def test_render_csv_escapes_quotes():
+    csv_content = app.render_csv([Term('「甲」', 'The "A" Act', "general"), Term("香港", "Hong Kong", "place")])
+    assert csv_content == (
+        'Source,Target,Category\n'
+        '"「甲」","The ""A"" Act","general"\n'
+        '"香港","Hong Kong","place"'
+    )
+
+
+def test_save_file_formats():
+    csv_content = app.render_csv([Term("香港", "Hong Kong", "place"), Term("研發", "R&D <Lab>", "technical")])
+
+    with open(app.save_file(csv_content, "csv"), encoding="utf-8-sig") as f:
+        assert f.read() == csv_content
+    with open(app.save_file(csv_content, "json"), encoding="utf-8") as f:
+        assert json.load(f) == {
+            "terms": [
+                {"source": "香港", "target": "Hong Kong", "category": "place"},
+                {"source": "研發", "target": "R&D <Lab>", "category": "technical"},
+            ],
+            "count": 2,
+        }
+    with open(app.save_file(csv_content, "tsv"), encoding="utf-8") as f:
+        assert f.read() == "香港\tHong Kong\n研發\tR&D <Lab>\n"
+    with open(app.save_file(csv_content, "tbx"), encoding="utf-8") as f:
+        tbx = f.read()
+    assert tbx.startswith('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE martif SYSTEM "TBXcoreStructV02.dtd">\n')
+    assert (
+        '      <termEntry id="t2">\n'
+        '        <descrip type="subjectField">technical</descrip>\n'
+        '        <langSet xml:lang="zh">\n'
+        '          <tig>\n'
+        '            <term>研發</term>\n'
+        '          </tig>\n'
+        '        </langSet>\n'
+        '        <langSet xml:lang="en">\n'
+        '          <tig>\n'
+        '            <term>R&amp;D &lt;Lab&gt;</term>\n'
+        '          </tig>\n'
+        '        </langSet>\n'
+        '      </termEntry>\n'
+    ) in tbx
+    assert tbx.endswith('    </body>\n  </text>\n</martif>')
+    assert app.save_file("", "csv") is None
+
+
+def test_top_terms_matches_full_sort():
+    rng = random.Random(0)
+    categories = list(app.CATEGORY_PRIORITY)
+    terms = []
+    for i in range(300):
+        term = Term(f"術語{i}", f"Term {i}" if i % 3 else f"term {i}", rng.choice(categories))
+        terms.extend([term] * rng.randint(1, 4))
+    top, unique_terms = app.top_terms(terms, 50, "medical")
+    expected = sorted(unique_terms, key=lambda t: app.rank_key(t, "medical"), reverse=True)[:50]
+    assert [t.source for t in top] == [t.source for t in expected]